@@ -4,7 +4,10 @@ a set of composable classes.
 这个模块提供了Paxos算法的实现，作为一组可组合的类。
 '''
 
-import collections
+import itertools
+import sys
+import typing
+
 
 # ProposalID
 #
@@ -20,29 +23,64 @@ import collections
 #
 #   (4,'C') > (4,'B') > (3,'Z')
 #
-# Named tuples from the collections module support all of the regular
-# tuple operations but additionally allow access to the contents by
-# name so the numeric component of the proposal ID may be referred to
-# via 'proposal_id.number' instead of 'proposal_id[0]'.
-# collections模块中的命名元组支持所有常规的元组操作，但另外允许通过名称访问内容，
+# Named tuples support all of the regular tuple operations but additionally
+# allow access to the contents by name so the numeric component of the
+# proposal ID may be referred to via 'proposal_id.number' instead of
+# 'proposal_id[0]'. Comparison and hashing are deliberately left to the
+# tuple base class which implements them in C.
+# 命名元组支持所有常规的元组操作，但另外允许通过名称访问内容，
 # 因此提案ID的数字组件可以通过'proposal_id.number'而不是'proposal_id[0]'来引用。
+# 比较和哈希特意留给用C实现的元组基类。
 #
-ProposalID = collections.namedtuple('ProposalID', ['number', 'uid'])
+class ProposalID (typing.NamedTuple):
+    number : int
+    uid    : typing.Any
+
+# Lower than any proposal id that may be generated by a Proposer. Used as the
+# initial value of Proposer.highest_accepted_id so that it may always be
+# compared against the last_accepted_id of received Promise messages.
+# 低于提案者可能生成的任何提案ID。用作Proposer.highest_accepted_id的初始值，
+# 以便始终可以将其与收到的Promise消息的last_accepted_id进行比较。
+_ZERO_PID = ProposalID(0, '')
+
+def _intern_uid(uid):
+    '''
+    String UIDs are interned so that the dictionaries keyed on the from_uid of
+    received messages match keys by identity rather than string comparison
+    字符串UID会被驻留，以便以收到消息的from_uid为键的字典通过标识而不是字符串比较来匹配键
+    '''
+    return sys.intern(uid) if type(uid) is str else uid
 
 class PaxosMessage (object):
     '''
-    Base class for all messages defined in this module
-    这个模块中定义的所有消息的基类
+    Base class for all messages defined in this module. String from_uid values
+    are interned by the subclass constructors.
+    这个模块中定义的所有消息的基类。字符串类型的from_uid值由子类构造函数驻留。
     '''
-    from_uid = None # Set by subclass constructor 由子类构造函数设置
+    __slots__ = [] # Subclasses declare the fields they set 子类声明它们设置的字段
+
+    # Maps lower-cased class name => message class for the messages defined in
+    # this module. Message classes defined elsewhere are not registered; they
+    # are dispatched through MessageHandler._lookup_handler() instead. Private
+    # base classes such as _AcceptLike are never sent and are skipped.
+    # 为此模块中定义的消息映射小写类名到消息类。在其他地方定义的消息类不会被注册，
+    # 而是通过MessageHandler._lookup_handler()进行分发。_AcceptLike等私有基类从不发送，因此被跳过。
+    _types = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__module__ == __name__ and not cls.__name__.startswith('_'):
+            PaxosMessage._types[ cls.__name__.lower() ] = cls
 
 class Prepare (PaxosMessage):
     '''
     Prepare messages should be broadcast to all Acceptors.
     Prepare消息应广播给所有接受者。
     '''
+    __slots__ = ['from_uid', 'proposal_id']
+
     def __init__(self, from_uid, proposal_id):
-        self.from_uid    = from_uid
+        self.from_uid    = _intern_uid(from_uid)
         self.proposal_id = proposal_id
 
 class Nack (PaxosMessage):
@@ -56,8 +94,10 @@ class Nack (PaxosMessage):
     它们用于向提案者发出信号，表明其当前的提案编号已过时，应选择新的编号。
     NACK可以作为对Prepare和Accept消息的响应发送。
     '''
+    __slots__ = ['from_uid', 'proposal_id', 'proposer_uid', 'promised_proposal_id']
+
     def __init__(self, from_uid, proposer_uid, proposal_id, promised_proposal_id):
-        self.from_uid             = from_uid
+        self.from_uid             = _intern_uid(from_uid)
         self.proposal_id          = proposal_id
         self.proposer_uid         = proposer_uid
         self.promised_proposal_id = promised_proposal_id
@@ -68,40 +108,51 @@ class Promise (PaxosMessage):
     the proposer_uid field
     Promise消息应至少发送给proposer_uid字段中指定的提案者。
     '''
+    __slots__ = ['from_uid', 'proposer_uid', 'proposal_id', 'last_accepted_id', 'last_accepted_value']
+
     def __init__(self, from_uid, proposer_uid, proposal_id, last_accepted_id, last_accepted_value):
-        self.from_uid             = from_uid
+        self.from_uid             = _intern_uid(from_uid)
         self.proposer_uid         = proposer_uid
         self.proposal_id          = proposal_id
         self.last_accepted_id     = last_accepted_id
         self.last_accepted_value  = last_accepted_value
 
-class Accept (PaxosMessage):
+class _AcceptLike (PaxosMessage):
     '''
-    Accept messages should be broadcast to all Acceptors
-    Accept消息应广播给所有接受者。
+    Shared layout of the Accept and Accepted messages which carry identical
+    fields and differ only in their type
+    Accept和Accepted消息的共享布局，它们携带相同的字段，仅类型不同
     '''
+    __slots__ = ['from_uid', 'proposal_id', 'proposal_value']
+
     def __init__(self, from_uid, proposal_id, proposal_value):
-        self.from_uid       = from_uid
+        self.from_uid       = _intern_uid(from_uid)
         self.proposal_id    = proposal_id
         self.proposal_value = proposal_value
 
-class Accepted (PaxosMessage):
+class Accept (_AcceptLike):
+    '''
+    Accept messages should be broadcast to all Acceptors
+    Accept消息应广播给所有接受者。
+    '''
+    __slots__ = []
+
+class Accepted (_AcceptLike):
     '''
     Accepted messages should be sent to all Learners
     Accepted消息应发送给所有学习者。
     '''
-    def __init__(self, from_uid, proposal_id, proposal_value):
-        self.from_uid       = from_uid
-        self.proposal_id    = proposal_id
-        self.proposal_value = proposal_value
+    __slots__ = []
 
 class Resolution (PaxosMessage):
     '''
     Optional message used to indicate that the final value has been selected
     可选消息，用于指示已选择最终值。
     '''
+    __slots__ = ['from_uid', 'value']
+
     def __init__(self, from_uid, value):
-        self.from_uid = from_uid
+        self.from_uid = _intern_uid(from_uid)
         self.value    = value
 
 class InvalidMessageError (Exception):
@@ -112,16 +163,111 @@ class InvalidMessageError (Exception):
     '''
 
 class MessageHandler (object):
+    '''
+    Handler functions are located once per class rather than once per message.
+    The _HANDLERS table maps each PaxosMessage subclass to the unbound
+    receive_<name> function of the handling class. _BATCH_HANDLERS does the
+    same for the optional receive_<name>_batch functions.
+    处理函数在每个类中只查找一次，而不是每条消息查找一次。
+    _HANDLERS表将每个PaxosMessage子类映射到处理类的未绑定receive_<name>函数。
+    _BATCH_HANDLERS对可选的receive_<name>_batch函数执行相同的操作。
+
+    Unless a subclass defines its own receive() method, it is additionally given
+    a generated receive() that tests the message type against each supported
+    message class in _DISPATCH_ORDER and falls back to the _HANDLERS table.
+    除非子类定义了自己的receive()方法，否则还会为其生成一个receive()，
+    该方法按_DISPATCH_ORDER顺序将消息类型与每个支持的消息类进行比较，并回退到_HANDLERS表。
+    '''
+    _HANDLERS       = dict()
+    _BATCH_HANDLERS = dict()
+
+    # Most to least frequently received message types 接收频率从高到低的消息类型
+    _DISPATCH_ORDER = ['accepted', 'promise', 'prepare', 'accept', 'nack', 'resolution']
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._HANDLERS       = dict()
+        cls._BATCH_HANDLERS = dict()
+        for name, mtype in PaxosMessage._types.items():
+            handler = getattr(cls, 'receive_' + name, None)
+            if handler is not None:
+                cls._HANDLERS[ mtype ] = handler
+            handler = getattr(cls, 'receive_' + name + '_batch', None)
+            if handler is not None:
+                cls._BATCH_HANDLERS[ mtype ] = handler
+        if cls.receive is MessageHandler.receive or getattr(cls.receive, '_generated', False):
+            cls.receive = cls._generate_receive()
+
+    @classmethod
+    def _generate_receive(cls):
+        '''
+        Returns a receive() function specialized for the message types this
+        class supports
+        返回针对此类支持的消息类型专门生成的receive()函数
+        '''
+        names = [ n for n in cls._DISPATCH_ORDER if n in PaxosMessage._types ]
+        names.extend( sorted( set(PaxosMessage._types) - set(names) ) )
+        
+        namespace = dict( _receive = MessageHandler.receive )
+        lines     = [ 'def receive(self, msg):', '    t = type(msg)' ]
+        for i, name in enumerate(names):
+            if PaxosMessage._types[ name ] in cls._HANDLERS:
+                namespace[ '_t%d' % i ] = PaxosMessage._types[ name ]
+                lines.append( '    if t is _t%d: return self.receive_%s(msg)' % (i, name) )
+        lines.append( '    return _receive(self, msg)' )
+        exec( '\n'.join(lines), namespace )
+
+        receive              = namespace['receive']
+        receive.__doc__      = MessageHandler.receive.__doc__
+        receive.__qualname__ = cls.__qualname__ + '.receive'
+        receive._generated   = True
+        return receive
+
     def receive(self, msg):
         '''
         Message dispatching function. This function accepts any PaxosMessage subclass and calls
         the appropriate handler function
         消息分发函数。此函数接受任何PaxosMessage子类并调用适当的处理函数。
         '''
-        handler = getattr(self, 'receive_' + msg.__class__.__name__.lower(), None)
+        handler = self._HANDLERS.get(type(msg))
+        if handler is None:
+            handler = self._lookup_handler(type(msg))
+        return handler(self, msg)
+
+    @classmethod
+    def _lookup_handler(cls, mtype):
+        '''
+        Slow path for message classes defined after the handling class
+        用于在处理类之后定义的消息类的慢速路径
+        '''
+        handler = getattr(cls, 'receive_' + mtype.__name__.lower(), None)
         if handler is None:
-            raise InvalidMessageError('Receiving class does not support messages of type: ' + msg.__class__.__name__)
-        return handler( msg )
+            raise InvalidMessageError('Receiving class does not support messages of type: ' + mtype.__name__)
+        cls._HANDLERS[ mtype ] = handler
+        return handler
+
+    def receive_batch(self, msgs):
+        '''
+        Dispatches a sequence of messages in order and returns a list of the
+        non-None responses. Consecutive messages of the same type are passed
+        together to a receive_<name>_batch method when the class defines one;
+        all other messages are passed to receive().
+        按顺序分发一系列消息，并返回非None响应的列表。当类定义了receive_<name>_batch方法时，
+        相同类型的连续消息会一起传递给该方法；所有其他消息都传递给receive()。
+        '''
+        replies = list()
+        for mtype, run in itertools.groupby(msgs, type):
+            batch_handler = self._BATCH_HANDLERS.get(mtype)
+            if batch_handler is not None:
+                reply = batch_handler( self, list(run) )
+                if reply is not None:
+                    replies.append( reply )
+            else:
+                for msg in run:
+                    reply = self.receive( msg )
+                    if reply is not None:
+                        replies.append( reply )
+        return replies
 
 class Proposer (MessageHandler):
     '''
@@ -131,22 +277,41 @@ class Proposer (MessageHandler):
     leader. 
     'leader'属性是一个布尔值，表示提案者是否认为自己是当前的领导者。
     这不是一个可靠的值，因为多个节点可能同时认为自己是领导者。
+
+    If the acceptor UIDs are known in advance, an 'acceptor_index' dictionary
+    mapping each acceptor UID to a distinct small integer (0..N-1) may be
+    supplied. Promises and Nacks are then tracked as bits of an integer mask
+    rather than as members of a set. Promises and Nacks from UIDs missing
+    from the index are ignored.
+    如果事先知道接受者的UID，可以提供一个'acceptor_index'字典，
+    将每个接受者UID映射到一个不同的小整数（0..N-1）。
+    然后，Promise和Nack将作为整数掩码的位而不是集合的成员进行跟踪。
+    来自索引中不存在的UID的Promise和Nack将被忽略。
     '''
     
     leader               = False
     proposed_value       = None
     proposal_id          = None
-    highest_accepted_id  = None
+    highest_accepted_id  = _ZERO_PID
     promises_received    = None
     nacks_received       = None
+    promises_received_mask = 0
+    nacks_received_mask    = 0
+    promises_count       = 0
+    nacks_count          = 0
     current_prepare_msg  = None
     current_accept_msg   = None
 
-    def __init__(self, network_uid, quorum_size):
+    def __init__(self, network_uid, quorum_size, acceptor_index=None):
         self.network_uid         = network_uid
         self.quorum_size         = quorum_size
+        self.acceptor_index      = acceptor_index
         self.proposal_id         = ProposalID(0, network_uid)
         self.highest_proposal_id = ProposalID(0, network_uid)
+        self.highest_accepted_id = _ZERO_PID
+        if acceptor_index is None:
+            self.promises_received   = set()
+            self.nacks_received      = set()
 
     def propose_value(self, value):
         '''
@@ -172,8 +337,14 @@ class Proposer (MessageHandler):
         此方法的一个副作用是清除当前设置的领导者标志。
         '''
         self.leader              = False
-        self.promises_received   = set()
-        self.nacks_received      = set()
+        if self.acceptor_index is None:
+            self.promises_received   = set()
+            self.nacks_received      = set()
+        else:
+            self.promises_received_mask = 0
+            self.nacks_received_mask    = 0
+            self.promises_count         = 0
+            self.nacks_count            = 0
         self.proposal_id         = ProposalID(self.highest_proposal_id.number + 1, self.network_uid)
         self.highest_proposal_id = self.proposal_id
         self.current_prepare_msg = Prepare(self.network_uid, self.proposal_id)
@@ -202,9 +373,20 @@ class Proposer (MessageHandler):
         '''
         self.observe_proposal( msg.promised_proposal_id )
         
-        if msg.proposal_id == self.proposal_id and self.nacks_received is not None:
-            self.nacks_received.add( msg.from_uid )
-            if len(self.nacks_received) == self.quorum_size:
+        if msg.proposal_id == self.proposal_id and self.current_prepare_msg is not None:
+            if self.acceptor_index is None:
+                self.nacks_received.add( msg.from_uid )
+                nacks = len(self.nacks_received)
+            else:
+                index = self.acceptor_index.get(msg.from_uid)
+                if index is None:
+                    return # Not a known acceptor 不是已知的接受者
+                bit = 1 << index
+                if not self.nacks_received_mask & bit:
+                    self.nacks_received_mask |= bit
+                    self.nacks_count         += 1
+                nacks = self.nacks_count
+            if nacks == self.quorum_size:
                 return self.prepare() # Lost leadership or failed to acquire it
 
     def receive_promise(self, msg):
@@ -213,17 +395,41 @@ class Proposer (MessageHandler):
         如果达到法定人数的Promise消息，则返回一个Accept消息。
         '''
         self.observe_proposal( msg.proposal_id )
-        if not self.leader and msg.proposal_id == self.proposal_id and msg.from_uid not in self.promises_received:
+        if self.leader:
+            return
+
+        # Duplicates are rejected before the proposal id comparison
+        # 在比较提案ID之前拒绝重复消息
+        if self.acceptor_index is None:
+            if msg.from_uid in self.promises_received or msg.proposal_id != self.proposal_id:
+                return
             self.promises_received.add( msg.from_uid )
-            if msg.last_accepted_id > self.highest_accepted_id:
-                self.highest_accepted_id = msg.last_accepted_id
-                if msg.last_accepted_value is not None:
-                    self.proposed_value = msg.last_accepted_value
-            if len(self.promises_received) == self.quorum_size:
-                self.leader = True
-                if self.proposed_value is not None:
-                    self.current_accept_msg = Accept(self.network_uid, self.proposal_id, self.proposed_value)
-                    return self.current_accept_msg
+            promises = len(self.promises_received)
+        else:
+            index = self.acceptor_index.get(msg.from_uid)
+            if index is None:
+                return # Not a known acceptor 不是已知的接受者
+            bit = 1 << index
+            if self.promises_received_mask & bit or msg.proposal_id != self.proposal_id:
+                return
+            self.promises_received_mask |= bit
+            self.promises_count         += 1
+            promises = self.promises_count
+
+        if msg.last_accepted_id is not None and msg.last_accepted_id > self.highest_accepted_id:
+            self.highest_accepted_id = msg.last_accepted_id
+            if msg.last_accepted_value is not None:
+                self.proposed_value = msg.last_accepted_value
+
+        if promises < self.quorum_size:
+            return
+
+        self.leader = True
+        if self.proposed_value is None:
+            return # propose_value() will return the Accept message propose_value()将返回Accept消息
+
+        self.current_accept_msg = Accept(self.network_uid, self.proposal_id, self.proposed_value)
+        return self.current_accept_msg
 
 class Acceptor (MessageHandler):
     '''
@@ -258,11 +464,13 @@ class Acceptor (MessageHandler):
         prior to transmitting the Promise message.
         返回Promise或Nack作为响应。在传输Promise消息之前，必须将接受者的状态持久化到磁盘。
         '''
-        if msg.proposal_id >= self.promised_id:
-            self.promised_id = msg.proposal_id
-            return Promise(self.network_uid, msg.from_uid, self.promised_id, self.accepted_id, self.accepted_value)
+        proposal_id = msg.proposal_id
+        promised_id = self.promised_id
+        if promised_id is None or proposal_id >= promised_id:
+            self.promised_id = proposal_id
+            return Promise(self.network_uid, msg.from_uid, proposal_id, self.accepted_id, self.accepted_value)
         else:
-            return Nack(self.network_uid, msg.from_uid, msg.proposal_id, self.promised_id)
+            return Nack(self.network_uid, msg.from_uid, proposal_id, promised_id)
 
     def receive_accept(self, msg):
         '''
@@ -270,13 +478,19 @@ class Acceptor (MessageHandler):
         to disk prior to transmitting the Accepted message.
         返回Accepted或Nack消息作为响应。在传输Accepted消息之前，必须将接受者的状态持久化到磁盘。
         '''
-        if msg.proposal_id >= self.promised_id:
-            self.promised_id     = msg.proposal_id
-            self.accepted_id     = msg.proposal_id
+        proposal_id = msg.proposal_id
+        promised_id = self.promised_id
+        if promised_id is None or proposal_id >= promised_id:
+            self.promised_id     = proposal_id
+            self.accepted_id     = proposal_id
             self.accepted_value  = msg.proposal_value
-            return Accepted(self.network_uid, msg.proposal_id, msg.proposal_value)
+            return Accepted(self.network_uid, proposal_id, msg.proposal_value)
         else:
-            return Nack(self.network_uid, msg.from_uid, msg.proposal_id, self.promised_id)
+            return Nack(self.network_uid, msg.from_uid, proposal_id, promised_id)
+
+# Record layout of the persisted Accepted messages accepted by Learner.bulk_replay()
+# Learner.bulk_replay()接受的持久化Accepted消息的记录布局
+ACCEPTED_RECORD_DTYPE = [('pid_num', 'i8'), ('pid_uid', 'i4'), ('from_uid', 'i4'), ('value_key', 'i8')]
 
 class Learner (MessageHandler):
     '''
@@ -285,10 +499,9 @@ class Learner (MessageHandler):
     这个类监听Accepted消息，确定何时选择最终值，并跟踪哪些对等方接受了最终值。
     '''
     class ProposalStatus (object):
-        __slots__ = ['accept_count', 'retain_count', 'acceptors', 'value']
+        __slots__ = ['accept_count', 'acceptors', 'value']
         def __init__(self, value):
-            self.accept_count = 0
-            self.retain_count = 0
+            self.accept_count = 0   # Total acceptances, including acceptors that have since moved on 接受总数，包括之后转向其他提案的接受者
             self.acceptors    = set()
             self.value        = value
 
@@ -300,6 +513,7 @@ class Learner (MessageHandler):
         self.final_value       = None
         self.final_acceptors   = None   # Will be a set of acceptor UIDs once the final value is chosen 一旦选择了最终值，将是接受者UID的集合
         self.final_proposal_id = None
+        self._final_resolution = None   # Resolution message shared by all calls after the final value is chosen 选择最终值后所有调用共享的Resolution消息
 
     def receive_accepted(self, msg):
         '''
@@ -309,50 +523,439 @@ class Learner (MessageHandler):
         new Acceptors to the final_acceptors set and return Resolution messages.
         当从接受者收到Accepted消息时调用。一旦确定了最终值，此方法的返回值将是包含一致值的Resolution消息。
         在选择解决方案后的后续调用将继续将新的接受者添加到final_acceptors集合中并返回Resolution消息。
+
+        Once the final value is chosen, messages are passed straight on to
+        _receive_accepted_finalized().
+        一旦选择了最终值，消息将直接传递给_receive_accepted_finalized()。
         '''
-        if self.final_value is not None:
-            if msg.proposal_id >= self.final_proposal_id and msg.proposal_value == self.final_value:
-                self.final_acceptors.add( msg.from_uid )
-            return Resolution(self.network_uid, self.final_value)
-            
-        last_pn = self.acceptors.get(msg.from_uid)
-        if msg.proposal_id <= last_pn:
-            return # Old message 旧消息
-        self.acceptors[ msg.from_uid ] = msg.proposal_id
-        
+        proposals = self.proposals
+        if proposals is None:
+            return self._receive_accepted_finalized(msg)
+
+        # Same steps as _record_accepted(), inlined to save a call per message
+        # 与_record_accepted()相同的步骤，内联以节省每条消息的一次调用
+        acceptors   = self.acceptors
+        from_uid    = msg.from_uid
+        proposal_id = msg.proposal_id
+
+        last_pn = acceptors.get(from_uid)
         if last_pn is not None:
-            ps = self.proposals[ last_pn ]
-            ps.retain_count -= 1
-            ps.acceptors.remove(msg.from_uid)
-            if ps.retain_count == 0:
-                del self.proposals[ last_pn ]
-        if not msg.proposal_id in self.proposals:
-            self.proposals[ msg.proposal_id ] = Learner.ProposalStatus(msg.proposal_value)
-        ps = self.proposals[ msg.proposal_id ]
-        assert msg.proposal_value == ps.value, 'Value mismatch for single proposal! 单个提案的值不匹配！'
+            if proposal_id <= last_pn:
+                return # Old message 旧消息
+            ps = proposals[ last_pn ]
+            ps.acceptors.remove(from_uid)
+            if not ps.acceptors:
+                del proposals[ last_pn ]
+        acceptors[ from_uid ] = proposal_id
+
+        ps = proposals.get(proposal_id)
+        if ps is None:
+            ps = proposals[ proposal_id ] = Learner.ProposalStatus(msg.proposal_value)
+        assert msg.proposal_value is ps.value or msg.proposal_value == ps.value, 'Value mismatch for single proposal! 单个提案的值不匹配！'
         ps.accept_count += 1
-        ps.retain_count += 1
-        ps.acceptors.add(msg.from_uid)
+        ps.acceptors.add(from_uid)
         if ps.accept_count == self.quorum_size:
-            self.final_proposal_id = msg.proposal_id
-            self.final_value       = msg.proposal_value
-            self.final_acceptors   = ps.acceptors
-            self.proposals         = None
-            self.acceptors         = None
-            return Resolution( self.network_uid, self.final_value )
+            return self._resolve(proposal_id, msg.proposal_value, ps.acceptors)
+
+    def receive_accepted_batch(self, msgs):
+        '''
+        Processes a list of Accepted messages in order. The result is the same as
+        calling receive_accepted() for each message but the per-message dispatch and
+        attribute lookup overhead is avoided. Returns a Resolution message if the
+        final value is known once the batch has been processed, otherwise None.
+        按顺序处理Accepted消息列表。结果与为每条消息调用receive_accepted()相同，
+        但避免了每条消息的分发和属性查找开销。如果处理完该批次后已知最终值，
+        则返回Resolution消息，否则返回None。
+        '''
+        msgs      = iter(msgs)
+        proposals = self.proposals
+        
+        if proposals is not None:
+            acceptors   = self.acceptors
+            quorum_size = self.quorum_size
+            record      = self._record_accepted
+            for msg in msgs:
+                ps = record(proposals, acceptors, msg)
+                if ps is not None and ps.accept_count == quorum_size:
+                    self._resolve(msg.proposal_id, msg.proposal_value, ps.acceptors)
+                    break
+            else:
+                return None
+
+        # Remaining messages only update the set of final acceptors
+        # 剩余的消息只更新最终接受者集合
+        finalized = self._receive_accepted_finalized
+        for msg in msgs:
+            finalized( msg )
+        return self._final_resolution
+
+    def _record_accepted(self, proposals, acceptors, msg):
+        '''
+        Updates the proposals and acceptors dictionaries for msg. Returns the
+        ProposalStatus of msg's proposal or None if msg is an old message. Used
+        by receive_accepted_batch(); receive_accepted() inlines the same steps.
+        为msg更新proposals和acceptors字典。返回msg所属提案的ProposalStatus，如果msg是旧消息则返回None。
+        由receive_accepted_batch()使用；receive_accepted()内联了相同的步骤。
+        '''
+        from_uid    = msg.from_uid
+        proposal_id = msg.proposal_id
+
+        last_pn = acceptors.get(from_uid)
+        if last_pn is not None:
+            if proposal_id <= last_pn:
+                return # Old message 旧消息
+            ps = proposals[ last_pn ]
+            ps.acceptors.remove(from_uid)
+            if not ps.acceptors:
+                del proposals[ last_pn ]
+        acceptors[ from_uid ] = proposal_id
+
+        ps = proposals.get(proposal_id)
+        if ps is None:
+            ps = proposals[ proposal_id ] = Learner.ProposalStatus(msg.proposal_value)
+        # The identity test avoids an O(len(value)) comparison when acceptors
+        # forward the proposer's value object unchanged. Run with -O to skip
+        # the check entirely.
+        # 当接受者原样转发提案者的值对象时，标识测试可避免O(len(value))的比较。
+        # 使用-O运行可完全跳过此检查。
+        assert msg.proposal_value is ps.value or msg.proposal_value == ps.value, 'Value mismatch for single proposal! 单个提案的值不匹配！'
+        ps.accept_count += 1
+        ps.acceptors.add(from_uid)
+        return ps
+
+    def bulk_replay(self, records, uids, values):
+        '''
+        Rebuilds the state of a newly created Learner from a persisted log of
+        Accepted messages held in a NumPy structured array with the
+        ACCEPTED_RECORD_DTYPE layout. The pid_uid and from_uid fields index
+        into the 'uids' sequence and value_key indexes into the 'values'
+        mapping. All records of a proposal must share the same value_key. The
+        resulting state is the same as if the records had been passed to
+        receive() in order. Returns a Resolution message if the log reaches a
+        quorum, otherwise None.
+        从保存在具有ACCEPTED_RECORD_DTYPE布局的NumPy结构化数组中的Accepted消息持久化日志
+        重建新创建的Learner的状态。pid_uid和from_uid字段是'uids'序列的索引，
+        value_key是'values'映射的键。同一提案的所有记录必须使用相同的value_key。
+        得到的状态与按顺序将这些记录传递给receive()的结果相同。
+        如果日志达到法定人数，则返回Resolution消息，否则返回None。
+        '''
+        import numpy # Optional dependency, only needed here 可选依赖项，仅此处需要
+
+        if self.proposals is None or self.acceptors:
+            raise ValueError('bulk_replay() requires a new Learner')
+
+        uid_list, rank = self._replay_uid_index(uids)
+        rank       = numpy.asarray(rank, dtype=numpy.int64)
+        pid_keys   = (records['pid_num'].astype(numpy.int64) << _PID_UID_BITS) | rank[ records['pid_uid'] ]
+        from_idx   = rank[ records['from_uid'] ]
+        value_keys = records['value_key'].astype(numpy.int64)
+
+        keys, first, inverse = numpy.unique(pid_keys, return_index=True, return_inverse=True)
+        assert (value_keys == value_keys[ first ][ inverse ]).all(), 'Value mismatch for single proposal! 单个提案的值不匹配！'
+
+        # Same bookkeeping as receive_accepted(), on integer keys
+        # 与receive_accepted()相同的簿记，使用整数键
+        i, proposals, acceptors = _replay_learner_steps(pid_keys, from_idx, self.quorum_size)
+
+        if i == -1:
+            key_values = dict( zip(keys.tolist(), value_keys[ first ].tolist()) )
+            self._restore_replay(proposals, acceptors, uid_list,
+                                 dict( (key, values[ key_values[ key ] ]) for key in proposals ))
+            return None
+
+        final_key       = int(pid_keys[ i ])
+        final_value     = values[ int(value_keys[ i ]) ]
+        final_acceptors = set( uid_idx for uid_idx, key in acceptors.items() if key == final_key )
+
+        # Later records are handled as _receive_accepted_finalized() would
+        # 之后的记录按_receive_accepted_finalized()的方式处理
+        tail_values = value_keys[ i+1: ]
+        matching    = [ vk for vk in numpy.unique(tail_values).tolist()
+                        if values[ vk ] is final_value or values[ vk ] == final_value ]
+        mask        = (pid_keys[ i+1: ] >= final_key) & numpy.isin(tail_values, matching)
+        final_acceptors.update( numpy.unique(from_idx[ i+1: ][ mask ]).tolist() )
+
+        number, uid_idx = decode_pid(final_key)
+        return self._resolve(ProposalID(number, uid_list[ uid_idx ]), final_value,
+                             set( uid_list[ a ] for a in final_acceptors ))
+
+    def _replay_uid_index(self, uids):
+        '''
+        Returns the UIDs in sorted order and, for each entry of 'uids', its index
+        in that order. Used by bulk_replay() to encode proposal ids.
+        返回排序后的UID，以及'uids'中每个条目在该顺序中的索引。由bulk_replay()用于编码提案ID。
+        '''
+        uid_list = sorted(uids)
+        if len(uid_list) > 1 << _PID_UID_BITS:
+            raise ValueError('bulk_replay() supports at most %d UIDs' % (1 << _PID_UID_BITS))
+        index = dict( (uid, i) for i, uid in enumerate(uid_list) )
+        return uid_list, [ index[ uid ] for uid in uids ]
+
+    def _restore_replay(self, proposals, acceptors, uid_list, proposal_values):
+        '''
+        Loads the integer-keyed state produced by bulk_replay()
+        加载由bulk_replay()产生的以整数为键的状态
+        '''
+        def proposal_id(key):
+            number, uid_idx = decode_pid(key)
+            return ProposalID(number, uid_list[ uid_idx ])
+
+        for key, (accept_count, retain_count) in proposals.items():
+            ps = Learner.ProposalStatus(proposal_values[ key ])
+            ps.accept_count = accept_count
+            self.proposals[ proposal_id(key) ] = ps
+
+        for uid_idx, key in acceptors.items():
+            pid = proposal_id(key)
+            self.proposals[ pid ].acceptors.add( uid_list[ uid_idx ] )
+            self.acceptors[ uid_list[ uid_idx ] ] = pid
+
+    def _resolve(self, proposal_id, value, acceptors):
+        '''
+        Records the final value once the accept count of a proposal has reached
+        the quorum size
+        当提案的接受计数达到法定人数时，记录最终值
+        '''
+        self.final_proposal_id = proposal_id
+        self.final_value       = value
+        self.final_acceptors   = acceptors
+        self.proposals         = None
+        self.acceptors         = None
+        self._final_resolution = Resolution( self.network_uid, self.final_value )
+        return self._final_resolution
+
+    def _receive_accepted_finalized(self, msg):
+        '''
+        Handles Accepted messages once the final value has been chosen. Adds
+        acceptors of the final value to the final_acceptors set and returns
+        the Resolution message.
+        在选择最终值后处理Accepted消息。将最终值的接受者添加到final_acceptors集合中，
+        并返回Resolution消息。
+        '''
+        # Acceptors already known to hold the final value skip the proposal id
+        # and value comparisons entirely
+        # 已知持有最终值的接受者将完全跳过提案ID和值的比较
+        if msg.from_uid not in self.final_acceptors \
+           and (msg.proposal_id is self.final_proposal_id or msg.proposal_id >= self.final_proposal_id) \
+           and (msg.proposal_value is self.final_value or msg.proposal_value == self.final_value):
+            self.final_acceptors.add( msg.from_uid )
+        return self._final_resolution
+
+# FastLearner encodes each ProposalID as a single integer:
+#
+#   (number << _PID_UID_BITS) | uid_index
+#
+# Provided the UID indices follow the sort order of the UIDs, encoded ids
+# compare in exactly the same manner as the ProposalID tuples.
+# FastLearner将每个ProposalID编码为单个整数。只要UID索引遵循UID的排序顺序，
+# 编码后的ID的比较方式与ProposalID元组完全相同。
+#
+_PID_UID_BITS = 16
+
+def encode_pid(number, uid_index):
+    '''
+    Packs a proposal number and UID index into a single integer key. Keys
+    compare in the same order as the corresponding (number, uid) ProposalIDs
+    when uid_index follows the sort order of the UIDs.
+    将提案编号和UID索引打包为单个整数键。当uid_index遵循UID的排序顺序时，
+    键的比较顺序与相应的(number, uid) ProposalID相同。
+    '''
+    if not 0 <= uid_index < 1 << _PID_UID_BITS:
+        raise ValueError('uid_index must be in the range [0, %d)' % (1 << _PID_UID_BITS))
+    return (number << _PID_UID_BITS) | uid_index
+
+def decode_pid(key):
+    '''
+    Returns the (number, uid_index) tuple packed into key by encode_pid()
+    返回由encode_pid()打包到key中的(number, uid_index)元组
+    '''
+    return (key >> _PID_UID_BITS, key & ((1 << _PID_UID_BITS) - 1))
+
+def _learner_steps(proposals, acceptors, pid_keys, uid_idxs, quorum_size):
+    '''
+    Integer-only version of the bookkeeping done by Learner.receive_accepted,
+    applied to each record of an encoded log. 'proposals' maps pid_key =>
+    (accept_count, retain_count) and 'acceptors' maps uid_idx => last accepted
+    pid_key. Returns the index of the record that reached a quorum or -1 if
+    none did.
+    Learner.receive_accepted所做簿记的纯整数版本，应用于编码日志的每条记录。
+    'proposals'将pid_key映射到(accept_count, retain_count)，'acceptors'将uid_idx映射到最后接受的pid_key。
+    返回达到法定人数的记录的索引，如果没有则返回-1。
+    '''
+    for i in range(len(pid_keys)):
+        pid_key = pid_keys[i]
+        uid_idx = uid_idxs[i]
+        last_pn = acceptors.get(uid_idx, -1)
+        if pid_key <= last_pn:
+            continue # Old message 旧消息
+        acceptors[ uid_idx ] = pid_key
+        if last_pn != -1:
+            accept_count, retain_count = proposals[ last_pn ]
+            if retain_count == 1:
+                del proposals[ last_pn ]
+            else:
+                proposals[ last_pn ] = (accept_count, retain_count - 1)
+        accept_count, retain_count = proposals.get(pid_key, (0, 0))
+        proposals[ pid_key ] = (accept_count + 1, retain_count + 1)
+        if accept_count + 1 == quorum_size:
+            return i
+    return -1
+
+_compiled_learner_steps = None
+
+def _replay_learner_steps(pid_keys, uid_idxs, quorum_size):
+    '''
+    Runs _learner_steps over the int64 arrays of an encoded log, starting from
+    empty state. Returns a tuple of the index of the resolving record (or -1)
+    and the resulting proposals and acceptors dictionaries. If Numba is
+    installed, it is imported and _learner_steps compiled on the first call;
+    the compiled code is cached on disk for later processes.
+    从空状态开始，在编码日志的int64数组上运行_learner_steps。返回一个元组：达到法定人数的记录的索引（或-1）
+    以及得到的proposals和acceptors字典。如果安装了Numba，则在首次调用时导入Numba并编译_learner_steps；
+    编译后的代码会缓存在磁盘上供之后的进程使用。
+    '''
+    global _compiled_learner_steps
+
+    if _compiled_learner_steps is None:
+        try:
+            import numba
+        except ImportError:
+            _compiled_learner_steps = False
+        else:
+            _compiled_learner_steps = numba.njit(cache=True)(_learner_steps)
+
+    if not _compiled_learner_steps:
+        proposals = dict()
+        acceptors = dict()
+        i = _learner_steps(proposals, acceptors, pid_keys.tolist(), uid_idxs.tolist(), quorum_size)
+        return i, proposals, acceptors
+
+    from numba import types
+    from numba.typed import Dict
+
+    proposals = Dict.empty(types.int64, types.UniTuple(types.int64, 2))
+    acceptors = Dict.empty(types.int64, types.int64)
+    i = _compiled_learner_steps(proposals, acceptors, pid_keys, uid_idxs, quorum_size)
+    return int(i), dict(proposals), dict(acceptors)
+
+class FastLearner (Learner):
+    '''
+    Learner variant for use when the full set of node UIDs is known in advance.
+    Proposal ids are encoded as integers and each proposal is tracked by a
+    small [accept_count, retain_count, value] list rather than a ProposalStatus
+    holding a set of acceptors. The loop used by bulk_replay() is JIT compiled
+    by Numba when it is installed. At most 2**16 UIDs are supported. Behavior
+    is otherwise identical to Learner.
+    当事先知道完整的节点UID集合时使用的Learner变体。提案ID被编码为整数，
+    每个提案由一个小的[accept_count, retain_count, value]列表而不是包含接受者集合的ProposalStatus跟踪。
+    在安装了Numba时，bulk_replay()使用的循环会被JIT编译。最多支持2**16个UID。其他行为与Learner相同。
+    '''
+    def __init__(self, network_uid, quorum_size, uids):
+        Learner.__init__(self, network_uid, quorum_size)
+        # self.proposals maps pid_key => [accept_count, retain_count, value]
+        # self.acceptors maps from_uid => last accepted pid_key
+        # self.proposals映射pid_key到[accept_count, retain_count, value]
+        # self.acceptors映射from_uid到最后接受的pid_key
+        self.uids      = sorted(uids) # index order must match UID order 索引顺序必须与UID顺序一致
+        self.uid_index = dict( (uid, i) for i, uid in enumerate(self.uids) )
+        if len(self.uids) > 1 << _PID_UID_BITS:
+            raise ValueError('FastLearner supports at most %d UIDs' % (1 << _PID_UID_BITS))
+
+    def receive_accepted(self, msg):
+        proposals = self.proposals
+        if proposals is None:
+            return self._receive_accepted_finalized(msg)
+
+        acceptors = self.acceptors
+        from_uid  = msg.from_uid
+        # encode_pid() inlined 内联的encode_pid()
+        pid_key   = (msg.proposal_id.number << _PID_UID_BITS) | self.uid_index[ msg.proposal_id.uid ]
+
+        last_key = acceptors.get(from_uid, -1)
+        if pid_key <= last_key:
+            return # Old message 旧消息
+        acceptors[ from_uid ] = pid_key
+        if last_key != -1:
+            ps = proposals[ last_key ]
+            if ps[1] == 1:
+                del proposals[ last_key ]
+            else:
+                ps[1] -= 1
+
+        ps = proposals.get(pid_key)
+        if ps is None:
+            ps = proposals[ pid_key ] = [0, 0, msg.proposal_value]
+        assert msg.proposal_value is ps[2] or msg.proposal_value == ps[2], 'Value mismatch for single proposal! 单个提案的值不匹配！'
+        ps[0] += 1
+        ps[1] += 1
+        if ps[0] == self.quorum_size:
+            return self._resolve_key(msg, pid_key)
+
+    def receive_accepted_batch(self, msgs):
+        msgs      = iter(msgs)
+        proposals = self.proposals
+
+        if proposals is not None:
+            # Same steps as receive_accepted() with the state held in locals
+            # 与receive_accepted()相同的步骤，状态保存在局部变量中
+            acceptors   = self.acceptors
+            uid_index   = self.uid_index
+            quorum_size = self.quorum_size
+            for msg in msgs:
+                from_uid = msg.from_uid
+                pid_key  = (msg.proposal_id.number << _PID_UID_BITS) | uid_index[ msg.proposal_id.uid ]
+
+                last_key = acceptors.get(from_uid, -1)
+                if pid_key <= last_key:
+                    continue # Old message 旧消息
+                acceptors[ from_uid ] = pid_key
+                if last_key != -1:
+                    ps = proposals[ last_key ]
+                    if ps[1] == 1:
+                        del proposals[ last_key ]
+                    else:
+                        ps[1] -= 1
+
+                ps = proposals.get(pid_key)
+                if ps is None:
+                    ps = proposals[ pid_key ] = [0, 0, msg.proposal_value]
+                assert msg.proposal_value is ps[2] or msg.proposal_value == ps[2], 'Value mismatch for single proposal! 单个提案的值不匹配！'
+                ps[0] += 1
+                ps[1] += 1
+                if ps[0] == quorum_size:
+                    self._resolve_key(msg, pid_key)
+                    break
+            else:
+                return None
+
+        return Learner.receive_accepted_batch(self, msgs)
+
+    def _replay_uid_index(self, uids):
+        return self.uids, [ self.uid_index[ uid ] for uid in uids ]
+
+    def _restore_replay(self, proposals, acceptors, uid_list, proposal_values):
+        for key, (accept_count, retain_count) in proposals.items():
+            self.proposals[ key ] = [accept_count, retain_count, proposal_values[ key ]]
+        for uid_idx, key in acceptors.items():
+            self.acceptors[ uid_list[ uid_idx ] ] = key
+
+    def _resolve_key(self, msg, pid_key):
+        acceptors = set( uid for uid, key in self.acceptors.items() if key == pid_key )
+        return self._resolve(msg.proposal_id, msg.proposal_value, acceptors)
 
 class PaxosInstance (Proposer, Acceptor, Learner):
     '''
     Aggregate Proposer, Accepter, & Learner class.
     聚合提案者、接受者和学习者类。
     '''
-    def __init__(self, network_uid, quorum_size, promised_id=None, accepted_id=None, accepted_value=None):
-        Proposer.__init__(self, network_uid, quorum_size)
+    def __init__(self, network_uid, quorum_size, promised_id=None, accepted_id=None, accepted_value=None,
+                 acceptor_index=None):
+        Proposer.__init__(self, network_uid, quorum_size, acceptor_index)
         Acceptor.__init__(self, network_uid, promised_id, accepted_id, accepted_value)
         Learner.__init__(self, network_uid, quorum_size)
     def receive_prepare(self, msg):
         self.observe_proposal( msg.proposal_id )
-        return super(PaxosInstance,self).receive_prepare(msg)
+        return Acceptor.receive_prepare(self, msg)
     def receive_accept(self, msg):
         self.observe_proposal( msg.proposal_id )
-        return super(PaxosInstance,self).receive_accept(msg)
\ No newline at end of file
+        return Acceptor.receive_accept(self, msg)
\ No newline at end of file
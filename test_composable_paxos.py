@@ -1,8 +1,14 @@
+import copy
 import sys
 import itertools
 import os.path
 import pickle
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #from twisted.trial import unittest
 import unittest
 
@@ -22,11 +28,128 @@ class ShortAsserts (object):
 
     def am(self, msg, mtype, **kwargs):
         self.ae(msg.__class__.__name__.lower(), mtype)
-        for k,v in kwargs.iteritems():
+        for k,v in kwargs.items():
             self.assertEquals(getattr(msg,k), v)
 
 
 
+class MessageTests (ShortAsserts, unittest.TestCase):
+
+    def test_messages_use_slots(self):
+        msgs = [ Prepare('A', PID(1,'A')),
+                 Nack('B', 'A', PID(1,'A'), PID(2,'C')),
+                 Promise('B', 'A', PID(1,'A'), None, None),
+                 Accept('A', PID(1,'A'), 'foo'),
+                 Accepted('B', PID(1,'A'), 'foo'),
+                 Resolution('B', 'foo') ]
+        for m in msgs:
+            self.at( not hasattr(m, '__dict__') )
+
+
+    def test_from_uid_interned(self):
+        uid = ''.join(['no', 'de', '1'])
+        self.at( Accepted(uid, PID(1,'A'), 'foo').from_uid is sys.intern('node1') )
+        self.ae( Accepted(1, PID(1,'A'), 'foo').from_uid, 1 )
+
+
+
+class EncodedProposalIDTests (ShortAsserts, unittest.TestCase):
+
+    def test_round_trip(self):
+        self.ae( decode_pid( encode_pid(0, 0) ), (0, 0) )
+        self.ae( decode_pid( encode_pid(7, 3) ), (7, 3) )
+        self.ae( decode_pid( encode_pid(2**40, 2**16 - 1) ), (2**40, 2**16 - 1) )
+
+
+    def test_uid_index_range(self):
+        self.assertRaises( ValueError, encode_pid, 1, 2**16 )
+        self.assertRaises( ValueError, encode_pid, 1, 70000 )
+        self.assertRaises( ValueError, encode_pid, 1, -1 )
+
+
+    def test_ordering(self):
+        uids = ['A', 'B', 'C']
+        pids = [ PID(n, u) for n in range(3) for u in uids ]
+        for p1, p2 in itertools.product(pids, pids):
+            k1 = encode_pid(p1.number, uids.index(p1.uid))
+            k2 = encode_pid(p2.number, uids.index(p2.uid))
+            self.ae( k1 < k2, p1 < p2 )
+            self.ae( k1 == k2, p1 == p2 )
+
+
+
+class MessageHandlerTests (ShortAsserts, unittest.TestCase):
+
+    def test_unsupported_message(self):
+        self.assertRaises( InvalidMessageError, Learner('A', 2).receive, Prepare('A', PID(1,'A')) )
+
+
+    def test_message_defined_after_handler(self):
+        class Ping (PaxosMessage):
+            def __init__(self, from_uid):
+                self.from_uid = from_uid
+
+        class Handler (MessageHandler):
+            def receive_ping(self, msg):
+                return msg.from_uid
+
+        class Pong (PaxosMessage):
+            def __init__(self, from_uid):
+                self.from_uid = from_uid
+
+        Handler.receive_pong = Handler.receive_ping
+
+        self.ae( Handler().receive( Ping('B') ), 'B' )
+        self.ae( Handler().receive( Pong('C') ), 'C' )
+        self.at( 'ping' not in PaxosMessage._types )
+        self.at( 'pong' not in PaxosMessage._types )
+
+
+    def test_private_base_not_registered(self):
+        self.ae( sorted(PaxosMessage._types),
+                 ['accept', 'accepted', 'nack', 'prepare', 'promise', 'resolution'] )
+
+
+    def test_same_named_message_does_not_replace_builtin(self):
+        class Accepted (PaxosMessage):
+            pass
+
+        self.at( PaxosMessage._types['accepted'] is not Accepted )
+        m = Learner('A', 1).receive( globals()['Accepted']('A', PID(1,'A'), 'foo') )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+
+
+    def test_generated_receive_uses_overrides(self):
+        class CountingLearner (Learner):
+            count = 0
+            def receive_accepted(self, msg):
+                self.count += 1
+                return Learner.receive_accepted(self, msg)
+
+        l = CountingLearner('A', 2)
+        l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        m = l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+        self.ae( l.count, 2 )
+        m = l.receive( Accepted('C', PID(1,'A'), 'foo') )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+        self.ae( l.count, 3 )
+        self.ae( l.final_acceptors, set(['A', 'B', 'C']) )
+
+
+    def test_custom_receive_preserved(self):
+        class Custom (Learner):
+            def receive(self, msg):
+                return 'custom'
+
+        class SubCustom (Custom):
+            pass
+
+        self.ae( Custom('A', 2).receive( Accepted('A', PID(1,'A'), 'foo') ), 'custom' )
+        self.ae( SubCustom('A', 2).receive( Accepted('A', PID(1,'A'), 'foo') ), 'custom' )
+
+
+
 class ProposerTests (ShortAsserts, unittest.TestCase):
 
 
@@ -133,10 +256,28 @@ class ProposerTests (ShortAsserts, unittest.TestCase):
         self.ae( self.num_promises(), 1 )
 
 
+    def test_recv_promise_quorum_without_value(self):
+        self.p.prepare()
+        m = self.p.receive( Promise('B', 'A', PID(1,'A'), None, None ) )
+        self.ae( m, None )
+        self.al( False )
+        m = self.p.receive( Promise('C', 'A', PID(1,'A'), None, None ) )
+        self.ae( m, None )
+        self.al( True )
+        m = self.p.propose_value( 'foo' )
+        self.am(m, 'accept', from_uid='A', proposal_id=PID(1,'A'), proposal_value='foo')
+
+
+    def test_recv_promise_before_prepare(self):
+        m = self.p.receive( Promise('B', 'B', PID(1,'B'), None, None ) )
+        self.ae( m, None )
+        self.ae( self.num_promises(), 0 )
+
+
     def test_recv_promise_propose_value_from_null(self):
         self.p.prepare()
         self.p.prepare()
-        self.ae( self.p.highest_accepted_id, None )
+        self.ae( self.p.highest_accepted_id, PID(0,'') )
         self.ae( self.p.proposed_value, None )
         self.p.receive( Promise('B', 'A', PID(2,'A'), PID(1,'B'), 'foo') )
         self.ae( self.p.highest_accepted_id, PID(1,'B') )
@@ -170,6 +311,38 @@ class ProposerTests (ShortAsserts, unittest.TestCase):
 
 
 
+
+class IndexedProposerTests (ProposerTests):
+
+    def setUp(self):
+        self.p = Proposer('A', 2, acceptor_index=dict(A=0, B=1, C=2))
+
+    def num_promises(self):
+        return self.p.promises_count
+
+
+    def test_duplicate_nacks_counted_once(self):
+        self.p.prepare()
+        self.p.receive( Nack('B', 'A', PID(1,'A'), PID(5,'B')) )
+        self.p.receive( Nack('B', 'A', PID(1,'A'), PID(5,'B')) )
+        self.ae( self.p.nacks_count, 1 )
+        self.ae( self.p.proposal_id, PID(1,'A') )
+        m = self.p.receive( Nack('C', 'A', PID(1,'A'), PID(5,'B')) )
+        self.am(m, 'prepare', proposal_id = PID(6,'A'))
+        self.ae( self.p.nacks_count, 0 )
+
+
+    def test_unknown_acceptor_ignored(self):
+        self.p.prepare()
+        self.ae( self.p.receive( Promise('Z', 'A', PID(0,'A'), None, None) ), None )
+        self.ae( self.p.receive( Promise('Z', 'A', PID(1,'A'), None, None) ), None )
+        self.ae( self.p.receive( Nack('Z', 'A', PID(1,'A'), PID(5,'B')) ), None )
+        self.ae( self.p.promises_count, 0 )
+        self.ae( self.p.nacks_count, 0 )
+        self.ae( self.p.highest_proposal_id, PID(5,'B') )
+
+
+
         
 class AcceptorTests (ShortAsserts, unittest.TestCase):
 
@@ -245,6 +418,16 @@ class AcceptorTests (ShortAsserts, unittest.TestCase):
         self.ae( self.a.promised_id,    PID(5,'A'))
 
 
+    def test_receive_batch(self):
+        replies = self.a.receive_batch([ Prepare('A', PID(1,'A')),
+                                         Accept('A', PID(1,'A'), 'foo'),
+                                         Prepare('B', PID(0,'B')) ])
+        self.ae( len(replies), 3 )
+        self.am(replies[0], 'promise', proposer_uid='A', proposal_id=PID(1,'A'))
+        self.am(replies[1], 'accepted', proposal_id=PID(1,'A'), proposal_value='foo')
+        self.am(replies[2], 'nack', proposal_id=PID(0,'B'), promised_proposal_id=PID(1,'A'))
+
+
 
 class LearnerTests (ShortAsserts, unittest.TestCase):
 
@@ -280,6 +463,45 @@ class LearnerTests (ShortAsserts, unittest.TestCase):
         self.ae(self.l.final_acceptors, set(['A', 'B']))
         
 
+    def test_resolution_reused_after_resolution(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        r = self.l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        self.am(r, 'resolution', from_uid='A', value='foo')
+        m = self.l.receive( Accepted('C', PID(1,'A'), 'foo') )
+        self.at( m is r )
+        self.ae(self.l.final_acceptors, set(['A', 'B', 'C']))
+        
+
+    def test_resolution_does_not_affect_other_instances(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        self.l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        self.ae( self.l.final_value, 'foo' )
+
+        self.setUp()
+        self.l.receive( Accepted('A', PID(1,'A'), 'bar') )
+        self.ae( self.l.final_value, None )
+        m = self.l.receive( Accepted('B', PID(1,'A'), 'bar') )
+        self.am(m, 'resolution', from_uid='A', value='bar')
+        
+
+    def test_base_class_call_after_resolution(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        r = self.l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        m = Learner.receive_accepted( self.l, Accepted('C', PID(1,'A'), 'foo') )
+        self.at( m is r )
+        self.ae( self.l.final_acceptors, set(['A', 'B', 'C']) )
+
+
+    def test_copy_after_resolution(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        self.l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        l2 = copy.copy( self.l )
+        l2.final_acceptors = set( self.l.final_acceptors )
+        l2.receive( Accepted('C', PID(1,'A'), 'foo') )
+        self.ae( l2.final_acceptors, set(['A', 'B', 'C']) )
+        self.ae( self.l.final_acceptors, set(['A', 'B']) )
+        
+
     def test_ignore_duplicate_messages(self):
         self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
         self.ae( self.l.final_value, None )
@@ -320,6 +542,208 @@ class LearnerTests (ShortAsserts, unittest.TestCase):
         self.ae( self.l.final_value, 'foo' )
 
 
+    def test_batch_resolution(self):
+        m = self.l.receive_accepted_batch([ Accepted('A', PID(1,'A'), 'bar'),
+                                            Accepted('B', PID(5,'A'), 'foo'),
+                                            Accepted('A', PID(1,'A'), 'bar') ])
+        self.ae( m, None )
+        self.ae( self.l.final_value, None )
+        m = self.l.receive_accepted_batch([ Accepted('A', PID(5,'A'), 'foo'),
+                                            Accepted('C', PID(5,'A'), 'foo'),
+                                            Accepted('C', PID(6,'A'), 'baz') ])
+        self.am(m, 'resolution', from_uid='A', value='foo')
+        self.ae( self.l.final_value, 'foo' )
+        self.ae(self.l.final_acceptors, set(['A', 'B', 'C']))
+
+
+    def test_batch_after_resolution(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        r = self.l.receive( Accepted('B', PID(1,'A'), 'foo') )
+        m = self.l.receive_accepted_batch([ Accepted('C', PID(1,'A'), 'foo') ])
+        self.at( m is r )
+        self.ae(self.l.final_acceptors, set(['A', 'B', 'C']))
+
+
+    def test_receive_batch(self):
+        replies = self.l.receive_batch([ Accepted('A', PID(1,'A'), 'foo'),
+                                         Accepted('B', PID(1,'A'), 'foo') ])
+        self.ae( len(replies), 1 )
+        self.am(replies[0], 'resolution', from_uid='A', value='foo')
+
+
+class FastLearnerTests (LearnerTests):
+
+    def setUp(self):
+        self.l = FastLearner('A', 2, ['C', 'B', 'A'])
+
+
+    def test_uid_order_preserved(self):
+        self.l.receive( Accepted('A', PID(5,'C'), 'foo') )
+        self.l.receive( Accepted('A', PID(5,'B'), 'bar') )
+        self.l.receive( Accepted('B', PID(5,'B'), 'bar') )
+        self.ae( self.l.final_value, None )
+        self.l.receive( Accepted('B', PID(5,'C'), 'foo') )
+        self.ae( self.l.final_value, 'foo' )
+        self.ae(self.l.final_acceptors, set(['A', 'B']))
+
+
+    def test_too_many_uids(self):
+        with self.assertRaises(ValueError):
+            FastLearner('A', 2, range((1 << 16) + 1))
+
+
+    def test_proposals_pruned(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        self.l.receive( Accepted('A', PID(2,'A'), 'bar') )
+        self.ae( list(self.l.proposals.values()), [[1, 1, 'bar']] )
+        self.l.receive_accepted_batch( [Accepted('A', PID(3,'A'), 'baz'),
+                                        Accepted('A', PID(1,'B'), 'old')] )
+        self.ae( list(self.l.proposals.values()), [[1, 1, 'baz']] )
+
+
+    def test_batch_unknown_acceptor(self):
+        m = self.l.receive_accepted_batch( [Accepted('A', PID(1,'A'), 'x'),
+                                            Accepted('Z', PID(1,'A'), 'x')] )
+        self.am(m, 'resolution', from_uid='A', value='x')
+        self.ae( self.l.final_acceptors, set(['A', 'Z']) )
+
+
+    def test_batch_unknown_proposer(self):
+        with self.assertRaises(KeyError):
+            self.l.receive_accepted_batch( [Accepted('A', PID(1,'A'), 'x'),
+                                            Accepted('B', PID(1,'Z'), 'y')] )
+        self.ae( self.l.acceptors, {'A': encode_pid(1, 0)} )
+        self.ae( list(self.l.proposals.values()), [[1, 1, 'x']] )
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class BulkReplayTests (ShortAsserts, unittest.TestCase):
+
+    uids   = ['C', 'A', 'B', 'D']
+    values = {7: 'foo', 8: 'bar'}
+
+    def create_learner(self, quorum_size):
+        return Learner('A', quorum_size)
+
+    def setUp(self):
+        self.l = self.create_learner(2)
+
+    def records(self, *accepted):
+        # accepted: (pid_number, pid_uid, from_uid, value_key)
+        return numpy.array([ (n, self.uids.index(pu), self.uids.index(fu), vk) for n, pu, fu, vk in accepted ],
+                           dtype=ACCEPTED_RECORD_DTYPE)
+
+    def state(self, l):
+        proposals = l.proposals
+        if proposals is not None:
+            proposals = dict( (k, (ps.accept_count, ps.acceptors, ps.value) if isinstance(ps, Learner.ProposalStatus) else ps)
+                              for k, ps in proposals.items() )
+        return (l.final_proposal_id, l.final_value, l.final_acceptors, proposals, l.acceptors)
+
+    def replay(self, *accepted):
+        # Replays into self.l and checks the result against sequential receive() calls
+        m  = self.l.bulk_replay( self.records(*accepted), self.uids, self.values )
+        l2 = self.create_learner(self.l.quorum_size)
+        for n, pu, fu, vk in accepted:
+            l2.receive( Accepted(fu, PID(n, pu), self.values[vk]) )
+        self.ae( m is None, l2.final_value is None )
+        if m is not None:
+            self.am(m, 'resolution', from_uid='A', value=l2.final_value)
+        self.ae( self.state(self.l), self.state(l2) )
+        return m
+
+
+    def test_empty(self):
+        m = self.replay()
+        self.ae( m, None )
+        self.ae( self.l.final_value, None )
+
+
+    def test_resolution(self):
+        m = self.replay( (1, 'A', 'A', 8),
+                         (5, 'C', 'B', 7),
+                         (5, 'C', 'A', 7),
+                         (5, 'C', 'C', 7) )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+        self.ae( self.l.final_proposal_id, PID(5,'C') )
+        self.ae( self.l.final_acceptors, set(['A', 'B', 'C']) )
+
+        m = self.l.receive( Accepted('A', PID(6,'A'), 'foo') )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+
+
+    def test_uid_order(self):
+        m = self.replay( (5, 'C', 'A', 7),
+                         (5, 'B', 'B', 8) )
+        self.ae( m, None )
+        m = self.l.receive( Accepted('B', PID(5,'C'), 'foo') )
+        self.am(m, 'resolution', from_uid='A', value='foo')
+        self.ae( self.l.final_acceptors, set(['A', 'B']) )
+
+
+    def test_partial_state(self):
+        m = self.replay( (1, 'A', 'A', 8),
+                         (1, 'A', 'A', 8),
+                         (2, 'B', 'A', 7),
+                         (3, 'A', 'B', 8),
+                         (4, 'C', 'C', 7) )
+        self.ae( m, None )
+
+
+    def test_old_records_ignored(self):
+        m = self.replay( (2, 'A', 'A', 8),
+                         (1, 'A', 'A', 7),
+                         (1, 'A', 'B', 7) )
+        self.ae( m, None )
+
+
+    def test_dropped_proposal_not_resolved(self):
+        m = self.replay( (1, 'A', 'A', 7),
+                         (2, 'A', 'A', 8),
+                         (1, 'A', 'B', 7) )
+        self.ae( m, None )
+
+
+    def test_dropped_proposal_count_reset(self):
+        self.l = self.create_learner(3)
+        m = self.replay( (1, 'A', 'A', 7),
+                         (2, 'A', 'A', 8),
+                         (1, 'A', 'B', 7),
+                         (1, 'A', 'C', 7) )
+        self.ae( m, None )
+
+
+    def test_lower_proposal_after_resolution(self):
+        m = self.replay( (2, 'B', 'B', 8),
+                         (2, 'B', 'A', 8),
+                         (1, 'A', 'C', 7),
+                         (1, 'A', 'D', 7) )
+        self.am(m, 'resolution', from_uid='A', value='bar')
+        self.ae( self.l.final_proposal_id, PID(2,'B') )
+        self.ae( self.l.final_acceptors, set(['A', 'B']) )
+
+
+    def test_late_acceptors_after_resolution(self):
+        m = self.replay( (1, 'A', 'A', 7),
+                         (1, 'A', 'B', 7),
+                         (2, 'B', 'C', 7),
+                         (3, 'B', 'D', 8),
+                         (1, 'A', 'A', 7) )
+        self.ae( self.l.final_acceptors, set(['A', 'B', 'C']) )
+
+
+    def test_requires_new_learner(self):
+        self.l.receive( Accepted('A', PID(1,'A'), 'foo') )
+        with self.assertRaises(ValueError):
+            self.l.bulk_replay( self.records(), self.uids, self.values )
+
+
+class FastBulkReplayTests (BulkReplayTests):
+
+    def create_learner(self, quorum_size):
+        return FastLearner('A', quorum_size, self.uids)
+
+
 class PaxosInstanceTester (ProposerTests, AcceptorTests, LearnerTests):
 
     def setUp(self):